@@ -0,0 +1,17 @@
+# Optional compiled kinematics, built in place next to controlbot_gym.py:
+#
+#   uv run --with setuptools --with cython python setup.py build_ext --inplace
+#
+# This is not part of the default install; without the extension the
+# simulation uses the Python kernels in controlbot_gym.py.
+from setuptools import Extension, setup
+from Cython.Build import cythonize
+
+setup(
+    name="controlbot",
+    py_modules=[],
+    package_dir={"": "simulation"},
+    ext_modules=cythonize(
+        [Extension("controlbot_kinematics", ["simulation/controlbot_kinematics.pyx"])]
+    ),
+)
@@ -0,0 +1,72 @@
+# Check that the diffdrive kernels agree with each other:
+#
+#   uv run simulation/check_kinematics.py
+#
+# The NumPy diffdrive is the reference; the plain Python, numba (when
+# installed) and Cython (when built) scalar kernels are compared against it.
+import numpy as np
+
+import controlbot_gym
+
+# float32 kernels on a 600 x 600 field: a few float32 ULPs of the coordinates
+POS_ATOL = 1e-3
+THETA_ATOL = 1e-5
+
+
+def sample_inputs(n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    x = rng.uniform(0, 600, n)
+    y = rng.uniform(0, 600, n)
+    theta = rng.uniform(-np.pi, np.pi, n)
+    v_l = rng.uniform(-10, 10, n)
+    # wheel speed differences from far below STRAIGHT_TOL (straight line)
+    # up to tight turns, including large-radius arcs
+    dv = rng.choice([-1, 1], n) * 10.0 ** rng.uniform(-9, 1, n)
+    v_r = v_l + dv
+    # also cover the exactly straight case
+    v_r[:10] = v_l[:10]
+    return [a.astype(np.float32) for a in (x, y, theta, v_l, v_r)]
+
+
+def scalar_kernels():
+    kernels = {"python": controlbot_gym._diffdrive_py}
+    if controlbot_gym._HAVE_NUMBA:
+        kernels["numba"] = controlbot_gym._jit_diffdrive()
+    try:
+        import controlbot_kinematics
+    except ImportError:
+        pass
+    else:
+        # the compiled tolerance is a constant in the .pyx
+        assert (
+            np.float32(controlbot_kinematics.STRAIGHT_TOL)
+            == controlbot_gym.STRAIGHT_TOL
+        ), "controlbot_kinematics.pyx and controlbot_gym.py STRAIGHT_TOL differ"
+        kernels["cython"] = controlbot_kinematics.diffdrive
+    return kernels
+
+
+def check(t=1.0, l=5.0):
+    x, y, theta, v_l, v_r = sample_inputs()
+    straight = np.abs(v_r - v_l) < controlbot_gym.STRAIGHT_TOL
+    reference = np.stack(
+        controlbot_gym.diffdrive(x, y, theta, v_l, v_r, t, np.float32(l)), axis=1
+    )
+
+    for name, kernel in scalar_kernels().items():
+        result = np.array(
+            [kernel(*args, t, l) for args in zip(x, y, theta, v_l, v_r)],
+            dtype=np.float64,
+        )
+        err = np.abs(result - reference).max(axis=0)
+        print(
+            f"{name}: max |dx| {err[0]:.2e}, |dy| {err[1]:.2e}, |dtheta| {err[2]:.2e}"
+        )
+        assert err[0] <= POS_ATOL and err[1] <= POS_ATOL, name
+        assert err[2] <= THETA_ATOL, name
+        # every kernel must use the same straight-line tolerance
+        assert (result[straight, 2] == theta[straight]).all(), name
+
+
+if __name__ == "__main__":
+    check()
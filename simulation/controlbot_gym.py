@@ -1,8 +1,23 @@
+import math
 from typing import Optional, Union
 import numpy as np
 import gymnasium as gym
 from gymnasium import spaces
 from gymnasium.error import DependencyNotInstalled
+from gymnasium.vector.utils import batch_space
+from gymnasium.utils import seeding
+
+try:
+    from numba import njit
+
+    _HAVE_NUMBA = True
+except ImportError:
+    # numba is optional (the "jit" extra), the kernels also run as plain Python
+    _HAVE_NUMBA = False
+
+    def njit(*args, **kwargs):
+        return lambda fn: fn
+
 
 from gymnasium.envs.registration import register
 
@@ -11,6 +26,37 @@ register(
     entry_point="controlbot_gym:ControlBotEnv",
 )
 
+# wheel speed difference below which motion is treated as a straight line
+STRAIGHT_TOL = np.float32(1e-6)
+
+# number of pre-rotated car sprites (a power of two)
+SPRITE_ANGLES = 256
+
+# extra pixels around the car redrawn each frame
+DIRTY_MARGIN = 1
+
+_PI = float(np.pi)
+_F32 = np.float32
+# float32 literal, so the numba kernel doesn't promote to float64; a Python
+# float otherwise, so the uncompiled kernel stays on Python floats
+_HALF = _F32(0.5) if _HAVE_NUMBA else 0.5
+
+# positions of the state variables in an observation vector
+OBS_IDX = {"x": 0, "y": 1, "dl": 2, "dr": 3, "theta": 4}
+
+# pygame is only imported once something is actually rendered
+pygame = None
+
+
+def _ensure_pygame():
+    global pygame
+    if pygame is None:
+        try:
+            import pygame
+        except ImportError as e:
+            raise DependencyNotInstalled("pygame is not installed") from e
+    return pygame
+
 
 class ControlBotEnv(gym.Env[np.ndarray, Union[int, np.ndarray]]):
 
@@ -19,72 +65,90 @@ class ControlBotEnv(gym.Env[np.ndarray, Union[int, np.ndarray]]):
         "render_fps": 10,
     }
 
-    def __init__(self, render_mode: Optional[str] = None):
+    def __init__(
+        self,
+        render_mode: Optional[str] = None,
+        validate: bool = False,
+        copy: bool = True,
+    ):
         max_speed = 10.0
         self.field_size = 600
         self.track_width = 5.0
 
-        self.action_space = gym.spaces.Dict(
-            {
-                "v_l": spaces.Box(-max_speed, max_speed, dtype=np.float32),
-                "v_r": spaces.Box(-max_speed, max_speed, dtype=np.float32),
-            }
-        )
-        self.observation_space = gym.spaces.Dict(
-            {
-                "x": spaces.Box(0, self.field_size, dtype=np.float32),
-                "y": spaces.Box(0, self.field_size, dtype=np.float32),
-                "dl": spaces.Box(-max_speed, max_speed, dtype=np.float32),
-                "dr": spaces.Box(-max_speed, max_speed, dtype=np.float32),
-                "theta": spaces.Box(-np.pi, np.pi, dtype=np.float32),
-            }
+        # action: (v_l, v_r)
+        self.action_space = spaces.Box(-max_speed, max_speed, shape=(2,), dtype=_F32)
+        # observation: (x, y, dl, dr, theta), see OBS_IDX
+        self.observation_space = spaces.Box(
+            np.array([0, 0, -max_speed, -max_speed, -_PI], dtype=_F32),
+            np.array(
+                [self.field_size, self.field_size, max_speed, max_speed, _PI],
+                dtype=_F32,
+            ),
+            dtype=_F32,
         )
 
+        # single preallocated observation buffer; like ControlBotVecEnv, a
+        # copy of it is returned unless copy=False, in which case every
+        # observation is this buffer, overwritten by the next step or reset
+        self._obs_buf = np.empty(5, dtype=_F32)
+        self.copy = copy
+
+        # check every action against action_space (off by default, it runs
+        # on every step)
+        self._validate = validate
+
+        # car triangle, relative to its rotation pivot
+        self._tri_template = get_triangle_template(10)
+
         self.render_mode = render_mode
+        self._render_on_step = render_mode == "human"
         self.screen = None
         self.clock = None
         self.isopen = True
 
     def step(self, action):
-        assert self.action_space.contains(
-            action
-        ), f"{action!r} ({type(action)}) invalid"
-
-        self.vl = action["v_l"][0]
-        self.vr = action["v_r"][0]
-
-        self.x, self.y, self.theta = self.diffdrive(
-            self.x,
-            self.y,
-            self.theta,
-            self.vl,
-            self.vr,
-            1,
-            self.track_width,
-        )
+        self.step_physics(action)
 
+        # x * (field_size - x) is negative exactly when x is off the field
+        x = self.x
+        y = self.y
         terminated = bool(
-            self.x < 0
-            or self.x > self.field_size
-            or self.y < 0
-            or self.y > self.field_size
+            x * (self.field_size - x) < 0 or y * (self.field_size - y) < 0
         )
 
         reward = 0.0 if terminated else 1.0
 
-        if self.render_mode == "human":
+        if self._render_on_step:
             self.render()
 
         return self._get_obs(), reward, terminated, False, {}
 
+    def step_physics(self, action, dt: float = 1.0):
+        # advance the kinematics by dt without rendering or building an
+        # observation, for driving the physics faster than the render rate
+        if self._validate:
+            assert self.action_space.contains(
+                action
+            ), f"{action!r} ({type(action)}) invalid"
+
+        # Python floats, so the state has the same type whichever scalar
+        # kernel (Python, numba or Cython) is in use
+        self.vl = vl = float(action[0])
+        self.vr = vr = float(action[1])
+
+        self.x, self.y, self.theta = _diffdrive_scalar(
+            self.x,
+            self.y,
+            self.theta,
+            vl,
+            vr,
+            dt,
+            self.track_width,
+        )
+
     def _get_obs(self):
-        return {
-            "x": np.array([self.x], dtype=np.float32),
-            "y": np.array([self.y], dtype=np.float32),
-            "dl": np.array([self.vl], dtype=np.float32),
-            "dr": np.array([self.vr], dtype=np.float32),
-            "theta": np.array([self.theta], dtype=np.float32),
-        }
+        self._obs_buf[:] = (self.x, self.y, self.vl, self.vr, self.theta)
+        return self._obs_buf.copy() if self.copy else self._obs_buf
 
     def reset(self, *, seed: Optional[int] = None, **kwargs):
         super().reset(seed=seed)
@@ -94,7 +158,7 @@ class ControlBotEnv(gym.Env[np.ndarray, Union[int, np.ndarray]]):
         self.y = self.field_size / 2
         self.theta = 0.0
 
-        if self.render_mode == "human":
+        if self._render_on_step:
             self.render()
 
         return self._get_obs(), {}
@@ -109,11 +173,7 @@ class ControlBotEnv(gym.Env[np.ndarray, Union[int, np.ndarray]]):
             )
             return
 
-        try:
-            import pygame
-            from pygame import gfxdraw
-        except ImportError as e:
-            raise DependencyNotInstalled("pygame is not installed") from e
+        _ensure_pygame()
 
         if self.screen is None:
             pygame.init()
@@ -124,99 +184,305 @@ class ControlBotEnv(gym.Env[np.ndarray, Union[int, np.ndarray]]):
                 )
             else:  # mode == "rgb_array"
                 self.screen = pygame.Surface((self.field_size, self.field_size))
+            self.surf = pygame.Surface((self.field_size, self.field_size))
+            self.surf.fill((255, 255, 255))
+            self._prev_rect = None
+            self._cur_rect = None
+            self._sprites = get_triangle_sprites(*self._tri_template, (255, 0, 0))
         if self.clock is None:
             self.clock = pygame.time.Clock()
 
-        self.surf = pygame.Surface((self.field_size, self.field_size))
-        self.surf.fill((255, 255, 255))
-
-        car = get_triangle(self.x, self.y, 10, self.theta)
-        pygame.draw.polygon(self.surf, (255, 0, 0), car)
-
-        self.surf = pygame.transform.flip(self.surf, False, True)
-        self.screen.blit(self.surf, (0, 0))
+        # only the previous and current car rects change between frames
+        self._prev_rect = self._cur_rect
+        if self._prev_rect is not None:
+            self.surf.fill((255, 255, 255), self._prev_rect)
+
+        # blit the pre-rotated sprite nearest to theta, centered on the pivot
+        # (y flipped so the field's origin is at the bottom left)
+        pivot = self._tri_template[1]
+        sprite = self._sprites[
+            round(self.theta * SPRITE_ANGLES / (2 * _PI)) & (SPRITE_ANGLES - 1)
+        ]
+        cx = int(self.x + pivot[0])
+        cy = int(self.field_size - self.y - pivot[1])
+        pos = sprite.get_rect(center=(cx, cy))
+        (self._cur_rect,) = self.surf.blits([(sprite, pos)])
+        self._cur_rect.inflate_ip(2 * DIRTY_MARGIN, 2 * DIRTY_MARGIN)
+
+        if self._prev_rect is None:
+            dirty = None
+            self.screen.blit(self.surf, (0, 0))
+        else:
+            dirty = self._cur_rect.union(self._prev_rect)
+            self.screen.blit(self.surf, dirty, dirty)
         if self.render_mode == "human":
             pygame.event.pump()
             self.clock.tick(self.metadata["render_fps"])
-            pygame.display.flip()
+            if dirty is None:
+                pygame.display.flip()
+            else:
+                pygame.display.update(dirty)
 
         elif self.render_mode == "rgb_array":
-            return np.transpose(
-                np.array(pygame.surfarray.pixels3d(self.screen)), axes=(1, 0, 2)
+            # tobytes emits rows, so the buffer is already (H, W, 3); wrap it in
+            # a bytearray so the returned frame is writeable, as before
+            buf = bytearray(pygame.image.tobytes(self.screen, "RGB"))
+            return np.frombuffer(buf, dtype=np.uint8).reshape(
+                self.field_size, self.field_size, 3
             )
 
     def close(self):
         if self.screen is not None:
-            import pygame
-
             pygame.display.quit()
             pygame.quit()
             self.isopen = False
 
-    def diffdrive(
-        self,
-        x: np.float32,
-        y: np.float32,
-        theta: np.float32,
-        v_l: np.float32,
-        v_r: np.float32,
-        t: int,  # time
-        l: np.float32,  # track_width
-    ):
-        # straight line
-        if v_l == v_r:
-            theta_n = theta
-            x_n = x + v_l * t * np.cos(theta)
-            y_n = y + v_l * t * np.sin(theta)
-
-        # circular motion
-        else:
-            # Calculate the radius
-            R = l / 2.0 * ((v_l + v_r) / (v_r - v_l))
 
-            # computing center of curvature
-            ICC_x = x - R * np.sin(theta)
-            ICC_y = y + R * np.cos(theta)
+class ControlBotVecEnv(gym.vector.VectorEnv):
+    """Explicitly vectorized ControlBotEnv: steps ``num_envs`` robots per call."""
 
-            # compute the angular velocity
-            omega = (v_r - v_l) / l
-
-            # computing angle change
-            dtheta = omega * t
-
-            # forward kinematics for differential drive
-            x_n = np.cos(dtheta) * (x - ICC_x) - np.sin(dtheta) * (y - ICC_y) + ICC_x
-            y_n = np.sin(dtheta) * (x - ICC_x) + np.cos(dtheta) * (y - ICC_y) + ICC_y
-            theta_n = theta + dtheta
-
-        return x_n, y_n, theta_n
-
-
-def rotate_point(x, y, cx, cy, theta):
-    cos_theta = np.cos(theta)
-    sin_theta = np.sin(theta)
-    dx = x - cx
-    dy = y - cy
-    new_x = cx + cos_theta * dx - sin_theta * dy
-    new_y = cy + sin_theta * dx + cos_theta * dy
-    return new_x, new_y
+    metadata = {
+        "render_modes": [],
+        "render_fps": 10,
+    }
 
+    def __init__(
+        self,
+        num_envs: int = 1,
+        render_mode: Optional[str] = None,
+        copy: bool = True,
+    ):
+        # the vectorized env has no render() (see metadata["render_modes"])
+        if render_mode is not None:
+            raise ValueError(f"ControlBotVecEnv cannot render, got {render_mode!r}")
+
+        single_env = ControlBotEnv()
+        self.field_size = _F32(single_env.field_size)
+        self.track_width = _F32(single_env.track_width)
+
+        # set the VectorEnv attributes directly: gymnasium 1.0 dropped the
+        # VectorEnv.__init__(num_envs, observation_space, action_space) signature
+        self.num_envs = num_envs
+        self.is_vector_env = True
+        self.closed = False
+        self.viewer = None
+        self.single_observation_space = single_env.observation_space
+        self.single_action_space = single_env.action_space
+        self.observation_space = batch_space(self.single_observation_space, num_envs)
+        self.action_space = batch_space(self.single_action_space, num_envs)
+        self.render_mode = render_mode
+        # like SyncVectorEnv, return a copy of the observations unless
+        # copy=False, in which case they are a view overwritten by each step
+        self.copy = copy
+
+        # per-robot state, one contiguous float32 row per variable (in
+        # OBS_IDX order); its transpose is the (num_envs, 5) observation
+        self._state = np.zeros((5, num_envs), dtype=_F32)
+        self.X, self.Y, self.VL, self.VR, self.Theta = self._state
+        self._obs = self._state.T
+
+        # the env has no time limit, so nothing is ever truncated
+        self._truncated = np.zeros(num_envs, dtype=np.bool_)
+
+    def step(self, actions):
+        self.VL[:] = actions[:, 0]
+        self.VR[:] = actions[:, 1]
+
+        self.X[:], self.Y[:], self.Theta[:] = diffdrive(
+            self.X,
+            self.Y,
+            self.Theta,
+            self.VL,
+            self.VR,
+            1,
+            self.track_width,
+        )
 
-def get_triangle(x, y, side_length, theta):
+        # X * (field_size - X) is negative exactly when X is off the field
+        F = self.field_size
+        terminated = ((self.X * (F - self.X)) < 0) | ((self.Y * (F - self.Y)) < 0)
+        reward = terminated.astype(_F32)
+        np.subtract(1.0, reward, out=reward)
+
+        # auto-reset robots that left the field, in place; like SyncVectorEnv,
+        # their last observation before the reset goes into the infos
+        infos = {}
+        if terminated.any():
+            final_obs = np.full(self.num_envs, None, dtype=object)
+            final_info = np.full(self.num_envs, None, dtype=object)
+            for i in np.flatnonzero(terminated):
+                final_obs[i] = self._obs[i].copy()
+                final_info[i] = {}
+            infos["final_observation"] = final_obs
+            infos["_final_observation"] = terminated.copy()
+            infos["final_info"] = final_info
+            infos["_final_info"] = terminated.copy()
+
+            self.VL[terminated] = 0.0
+            self.VR[terminated] = 0.0
+            self.X[terminated] = self.field_size / 2
+            self.Y[terminated] = self.field_size / 2
+            self.Theta[terminated] = 0.0
+
+        obs = self._obs.copy() if self.copy else self._obs
+        return obs, reward, terminated, self._truncated, infos
+
+    def reset(self, *, seed: Optional[int] = None, options: Optional[dict] = None):
+        if seed is not None:
+            self._np_random, seed = seeding.np_random(seed)
+        self.VL[:] = 0.0
+        self.VR[:] = 0.0
+        self.X[:] = self.field_size / 2
+        self.Y[:] = self.field_size / 2
+        self.Theta[:] = 0.0
+
+        obs = self._obs.copy() if self.copy else self._obs
+        return obs, {}
+
+
+def diffdrive(
+    x: np.ndarray,
+    y: np.ndarray,
+    theta: np.ndarray,
+    v_l: np.ndarray,
+    v_r: np.ndarray,
+    t: float,  # time
+    l: float,  # track_width
+):
+    # differential drive kinematics over SoA arrays (one lane per robot);
+    # straight-line and circular motion are evaluated for every lane and
+    # selected with np.where so the whole batch is a handful of ufunc calls
+    dv = v_r - v_l
+    straight = np.abs(dv) < STRAIGHT_TOL
+    dv = np.where(straight, 0.0, dv)
+
+    # Calculate the radius (guard the denominator of straight-line lanes)
+    R = l / 2.0 * ((v_l + v_r) / np.where(straight, 1.0, dv))
+
+    cos_t = np.cos(theta)
+    sin_t = np.sin(theta)
+
+    # compute the angular velocity
+    omega = dv / l
+
+    # computing angle change (zero for straight-line lanes)
+    dtheta = omega * t
+    sin_d = np.sin(dtheta)
+    h = np.sin(dtheta * 0.5)
+    versin_d = (h + h) * h  # 1 - cos(dtheta)
+
+    # forward kinematics for differential drive: rotation about the center
+    # of curvature (x - R sin_t, y + R cos_t), written relative to (x, y) so
+    # large radii don't cancel in float32
+    x_n = np.where(
+        straight,
+        x + v_l * t * cos_t,
+        x + R * (cos_t * sin_d - sin_t * versin_d),
+    )
+    y_n = np.where(
+        straight,
+        y + v_l * t * sin_t,
+        y + R * (sin_t * sin_d + cos_t * versin_d),
+    )
+    theta_n = theta + dtheta
+
+    return x_n, y_n, theta_n
+
+
+def _diffdrive_py(x, y, theta, v_l, v_r, t, l):
+    # scalar diffdrive for the single-robot env; see _jit_diffdrive
+
+    cos_t = math.cos(theta)
+    sin_t = math.sin(theta)
+
+    # straight line
+    if abs(v_r - v_l) < STRAIGHT_TOL:
+        theta_n = theta
+        x_n = x + v_l * t * cos_t
+        y_n = y + v_l * t * sin_t
+
+    # circular motion
+    else:
+        # Calculate the radius
+        R = l * _HALF * ((v_l + v_r) / (v_r - v_l))
+
+        # compute the angular velocity
+        omega = (v_r - v_l) / l
+
+        # computing angle change
+        dtheta = omega * t
+        sin_d = math.sin(dtheta)
+        h = math.sin(dtheta * _HALF)
+        versin_d = (h + h) * h  # 1 - cos(dtheta)
+
+        # forward kinematics for differential drive: rotation about the
+        # center of curvature, relative to (x, y) (see diffdrive)
+        x_n = x + R * (cos_t * sin_d - sin_t * versin_d)
+        y_n = y + R * (sin_t * sin_d + cos_t * versin_d)
+        theta_n = theta + dtheta
+
+    return x_n, y_n, theta_n
+
+
+def _jit_diffdrive():
+    # compile _diffdrive_py to native float32 code with numba (returned
+    # unchanged when numba isn't installed); only done when the Cython
+    # kernel isn't built, so there's no import-time compile otherwise
+    return njit(
+        "UniTuple(float32, 3)(float32, float32, float32, float32, float32, float32, float32)",
+        cache=True,
+        fastmath=True,
+    )(_diffdrive_py)
+
+
+def get_triangle_template(side_length):
     # Calculate height of the equilateral triangle
     height = 1.5 * side_length
 
-    # Define the three points of the equilateral triangle centered at the base
-    p1 = (x, y - side_length / 2)  # Left base point
-    p2 = (x, y + side_length / 2)  # Right base point
-    p3 = (x + height, y)  # Top point
-
-    # Rotate points around the center of the base
-    center_x = x
-    center_y = y + height / 3  # Center of the triangle to rotate around
-
-    p1_rotated = rotate_point(p1[0], p1[1], center_x, center_y, theta)
-    p2_rotated = rotate_point(p2[0], p2[1], center_x, center_y, theta)
-    p3_rotated = rotate_point(p3[0], p3[1], center_x, center_y, theta)
-
-    return [p1_rotated, p2_rotated, p3_rotated]
+    # Center of the triangle to rotate around, relative to (x, y)
+    pivot = (0.0, height / 3)
+
+    # The three points of the equilateral triangle centered at the base,
+    # relative to the pivot: left base point, right base point, top point
+    offsets = (
+        (0.0, -side_length / 2 - height / 3),
+        (0.0, side_length / 2 - height / 3),
+        (height, -height / 3),
+    )
+
+    return offsets, pivot
+
+
+def get_triangle(x, y, theta, offsets, pivot):
+    # Rotate the template around the pivot; one cos/sin pair for all points
+    c = math.cos(theta)
+    s = math.sin(theta)
+    cx = x + pivot[0]
+    cy = y + pivot[1]
+
+    return [(cx + c * dx - s * dy, cy + s * dx + c * dy) for dx, dy in offsets]
+
+
+def get_triangle_sprites(offsets, pivot, color):
+    # Rasterize the triangle once, with the pivot at the sprite's center
+    # (pygame rotates around the center), then rotate it to every angle
+    size = math.ceil(2 * max(math.hypot(dx, dy) for dx, dy in offsets)) + 2
+    base = pygame.Surface((size, size), pygame.SRCALPHA)
+    car = get_triangle(size / 2 - pivot[0], size / 2 - pivot[1], 0.0, offsets, pivot)
+    # flip y so the field's origin is at the bottom left
+    car = [(px, size - py) for px, py in car]
+    pygame.draw.polygon(base, color, car)
+
+    return [
+        pygame.transform.rotate(base, 360.0 * i / SPRITE_ANGLES)
+        for i in range(SPRITE_ANGLES)
+    ]
+
+
+try:
+    # compiled kernel, available once controlbot_kinematics.pyx is built
+    import controlbot_kinematics
+except ImportError:
+    _diffdrive_scalar = _jit_diffdrive()
+else:
+    _diffdrive_scalar = controlbot_kinematics.diffdrive
@@ -0,0 +1,56 @@
+# cython: language_level=3, cdivision=True
+# Compiled version of the scalar diffdrive kernel in controlbot_gym.py; the
+# Python version there is used when this extension is not built.
+
+from libc.math cimport sinf, cosf, fabsf
+
+# wheel speed difference below which motion is treated as a straight line;
+# a compile-time constant that must match controlbot_gym.STRAIGHT_TOL
+# (check_kinematics.py checks that it does)
+DEF _STRAIGHT_TOL = 1e-6
+STRAIGHT_TOL = <float>_STRAIGHT_TOL
+
+
+cpdef (float, float, float) diffdrive(
+    float x,
+    float y,
+    float theta,
+    float v_l,
+    float v_r,
+    float t,  # time
+    float l,  # track_width
+):
+    # float32 throughout, matching the observation buffer and the numba kernel
+    cdef float cos_t = cosf(theta)
+    cdef float sin_t = sinf(theta)
+    cdef float R, omega, dtheta, sin_d, h, versin_d
+    cdef float x_n, y_n, theta_n
+
+    # straight line
+    if fabsf(v_r - v_l) < <float>_STRAIGHT_TOL:
+        theta_n = theta
+        x_n = x + v_l * t * cos_t
+        y_n = y + v_l * t * sin_t
+
+    # circular motion
+    else:
+        # Calculate the radius
+        R = l / 2 * ((v_l + v_r) / (v_r - v_l))
+
+        # compute the angular velocity
+        omega = (v_r - v_l) / l
+
+        # computing angle change
+        dtheta = omega * t
+        sin_d = sinf(dtheta)
+        h = sinf(dtheta / 2)
+        versin_d = (h + h) * h  # 1 - cos(dtheta)
+
+        # forward kinematics for differential drive: rotation about the
+        # center of curvature, relative to (x, y) (see diffdrive)
+        x_n = x + R * (cos_t * sin_d - sin_t * versin_d)
+        y_n = y + R * (sin_t * sin_d + cos_t * versin_d)
+        theta_n = theta + dtheta
+
+    return x_n, y_n, theta_n
+
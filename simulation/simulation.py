@@ -15,48 +15,81 @@ dv = 0.1  # velocity increment
 vmin = 0  # minimum velocity
 vmax = 10  # maximum velocity
 last_theta = 0  # last known angle
+log_batch = 64  # log rows buffered between writes
+physics_steps = 10  # physics steps per rendered frame
+physics_dt = 1 / physics_steps  # physics time step
+
+# action buffer (v_l, v_r), reused across steps
+action = np.empty(2, dtype=np.float32)
 
 # open a csv file for logging
-with open(f"logs/log_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv", "w") as f:
-
-    quit = False
-    while not quit:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                quit = True
-
-        # detect key presses
-        keys = pygame.key.get_pressed()
-
-        # reset env on "r"
-        if keys[pygame.K_r]:
-            env.reset()
-            vl = 0
-            vr = 0
-
-        # stop wheels on "space"
-        if keys[pygame.K_SPACE]:
-            vl = 0
-            vr = 0
-
-        # increment left/right wheel velocity while left/right shift is pressed; decrement otherwise
-        l = keys[pygame.K_LSHIFT]
-        r = keys[pygame.K_RSHIFT]
-        vl = min(max(vl + (dv if l else -dv), vmin), vmax)
-        vr = min(max(vr + (dv if r else -dv), vmin), vmax)
-
-        # send action to the environment
-        action = {
-            "v_l": np.array([vl], dtype=np.float32),
-            "v_r": np.array([vr], dtype=np.float32),
-        }
-        observation, reward, terminated, truncated, info = env.step(action)
-        theta = observation["theta"][0]
-        d_theta = theta - last_theta
-        last_theta = theta
-
-        # log actions & observed state
-        if vl != 0 or vr != 0:
-            f.write(f"{vl},{vr},{d_theta}\n")
+log_path = f"logs/log_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv"
+with open(log_path, "w", buffering=1 << 16) as f:
+    # rows are collected here and written every log_batch rows
+    log_rows = []
+
+    # hoist loop-invariant lookups into locals
+    sim = env.unwrapped
+    step_physics = sim.step_physics
+    render = env.render
+    get_events = pygame.event.get
+    get_pressed = pygame.key.get_pressed
+    QUIT = pygame.QUIT
+    KL = pygame.K_LSHIFT
+    KR = pygame.K_RSHIFT
+    KRS = pygame.K_r
+    KSP = pygame.K_SPACE
+    log_row = log_rows.append
+    F32 = np.float32
+
+    # flush the buffered rows even if the loop exits with an exception
+    try:
+        quit = False
+        while not quit:
+            for event in get_events():
+                if event.type == QUIT:
+                    quit = True
+
+            # detect key presses
+            keys = get_pressed()
+
+            # reset env on "r"
+            if keys[KRS]:
+                env.reset()
+                vl = 0
+                vr = 0
+
+            # stop wheels on "space"
+            if keys[KSP]:
+                vl = 0
+                vr = 0
+
+            # increment left/right wheel velocity while left/right shift is pressed; decrement otherwise
+            vl = vl + dv if keys[KL] else vl - dv
+            vr = vr + dv if keys[KR] else vr - dv
+            vl = vl if vmin <= vl <= vmax else (vmin if vl < vmin else vmax)
+            vr = vr if vmin <= vr <= vmax else (vmin if vr < vmin else vmax)
+
+            # send action to the environment; physics runs at a fixed time step,
+            # decoupled from the render rate
+            action[0] = vl
+            action[1] = vr
+            for _ in range(physics_steps):
+                step_physics(action, physics_dt)
+            render()
+            # log the heading as float32, as the observation reports it (the
+            # env keeps it as a Python float); over physics_steps sub-steps
+            # d_theta can differ from one dt=1 step by a few float32 ULPs
+            theta = F32(sim.theta)
+            d_theta = theta - last_theta
+            last_theta = theta
 
+            # log actions & observed state
+            if vl != 0 or vr != 0:
+                log_row(f"{vl},{vr},{d_theta}\n")
+                if len(log_rows) >= log_batch:
+                    f.writelines(log_rows)
+                    log_rows.clear()
+    finally:
+        f.writelines(log_rows)
     env.close()